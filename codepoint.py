@@ -1,8 +1,26 @@
-from unicodedata import bidirectional
+from itertools import chain
 
 import parse_ucd
-
-__all__ = ["Codepoint"]
+from parse_ucd import DIGIT_OFFSET, NOT_NUMERIC, NUMERIC_EXTRA, NumericType, as_fraction
+
+__all__ = [
+    "Codepoint",
+    "NumericType",
+    "as_fraction",
+    "bidirectional_class",
+    "decomposition",
+    "general_category",
+    "name",
+    "numeric_type",
+    "numeric_type_id",
+    "numeric_value",
+    "script",
+    "script_id",
+    "script_names",
+]
+
+# Sentinel for methods whose default argument is optional:
+NoDefault = object()
 
 
 class Codepoint:
@@ -45,9 +63,22 @@ class Codepoint:
     __slots__ = ("_ord",)
 
     MAX_CODE_POINT = 0x10FFFF
+    MAX_BMP_CODE_POINT = 0xFFFF
+
+    # Codepoints are immutable, so get() can share one instance per BMP code point:
+    _bmp_cache = [None] * (MAX_BMP_CODE_POINT + 1)
 
     def __init__(self, codepoint: int):
-        assert 0 <= codepoint <= self.MAX_CODE_POINT
+        """
+        >>> Codepoint(-1)
+        Traceback (most recent call last):
+          ...
+        ValueError: not a code point: -1
+        """
+        # Not an assert: the properties look up _ord without a bounds check, so this
+        # must still be checked under python -O.
+        if not 0 <= codepoint <= self.MAX_CODE_POINT:
+            raise ValueError(f"not a code point: {codepoint!r}")
         self._ord = codepoint
 
     @property
@@ -56,6 +87,8 @@ class Codepoint:
 
     @property
     def character(self) -> str:
+        # Not cached in a slot: most code points are only asked for their character
+        # once, and lazily filling a slot makes that first access twice as slow.
         return chr(self._ord)
 
     @property
@@ -64,64 +97,76 @@ class Codepoint:
 
     @property
     def general_category(self) -> str:
-        return _properties.general_category[self._ord]
+        return _general_category_of(self._ord)
 
     @property
     def script(self) -> str:
-        return _properties.script[self._ord]
+        return _script_of(self._ord)
 
     @property
     def bidirectional_class(self) -> str:
-        # I'd love to remove the call to Python's built-in unicodedata.bidirectional,
-        # but it requires parsing YET ANOTHER file, which I don't feel like doing 😇
-        return bidirectional(self.character)
+        return _bidi_class_of(self._ord)
 
     @property
     def numeric_type(self):
-        return _properties.numeric_type[self._ord]
+        return _numeric_type_of(self._ord)
 
     @property
     def numeric_value(self):
-        return _properties.numeric_value[self._ord]
+        return _numeric_value_of(self._ord)
 
     @property
     def decomposition(self) -> str:
-        return _properties.decomposition[self._ord]
+        return _decomposition_of(self._ord)
 
-    def to_decimal(self, *args) -> int:
-        if self.numeric_type == "Decimal":
-            return _properties.numeric_value[self._ord]
+    def to_decimal(self, default=NoDefault) -> int:
+        value = _numeric_table[self._ord]
+        if 0 <= value <= 9:
+            return value
 
-        if not args:
+        if default is NoDefault:
             raise ValueError
-        else:
-            return args[0]
+        return default
 
-    def to_digit(self, *args) -> int:
-        if self.numeric_type in ("Decimal", "Digit"):
-            return _properties.numeric_value[self._ord]
+    def to_digit(self, default=NoDefault) -> int:
+        value = _numeric_table[self._ord]
+        if 0 <= value <= 9:
+            return value
+        if value >= DIGIT_OFFSET:
+            return value - DIGIT_OFFSET
 
-        if not args:
+        if default is NoDefault:
             raise ValueError
-        else:
-            return args[0]
-
-    def to_numeric(self, *args) -> float:
-        if self.numeric_type is not None:
-            return float(_properties.numeric_value[self._ord])
-
-        if not args:
+        return default
+
+    def to_numeric(self, default=NoDefault) -> float:
+        value = _numeric_table[self._ord]
+        if value >= 0:
+            # Both Decimal and Digit values are stored modulo DIGIT_OFFSET.
+            return float(value % DIGIT_OFFSET)
+        if value == NUMERIC_EXTRA:
+            # Already a float. For the exact value of a fraction, use
+            # as_fraction(self.numeric_value):
+            return _numeric_extra[self._ord]
+
+        if default is NoDefault:
             raise ValueError
-        else:
-            return args[0]
+        return default
 
     def to_uplus_notation(self) -> str:
         """
         Returns a string representation of the codepoint in U+ notation.
 
         See: https://www.unicode.org/versions/Unicode13.0.0/appA.pdf
+
+        >>> Codepoint(0x0030).to_uplus_notation()
+        'U+0030'
+        >>> Codepoint(0x1D2E0).to_uplus_notation()
+        'U+1D2E0'
         """
-        return f"U+{self.value:04X}"
+        # Not cached, for the same reason as character: sweeps format each code point
+        # only once.
+        return f"U+{self._ord:04X}"
 
     def __str__(self) -> str:
         return self.to_uplus_notation()
@@ -136,7 +181,138 @@ class Codepoint:
         >>> len(list(Codepoint.iterate_all_codepoints()))
         1114112
         """
-        return (Codepoint(cp) for cp in range(Codepoint.MAX_CODE_POINT + 1))
+        bmp = range(Codepoint.MAX_BMP_CODE_POINT + 1)
+        supplementary = range(bmp.stop, Codepoint.MAX_CODE_POINT + 1)
+        return chain(map(Codepoint.get, bmp), map(Codepoint, supplementary))
+
+    @staticmethod
+    def iterate_numeric_codepoints():
+        """
+        Like iterate_all_codepoints(), but skips every code point without a
+        Numeric_Type. Only about 1% of code points are numeric, so this finds them with
+        one vectorized pass over the packed numeric table. Requires NumPy.
+
+        >>> numerals = list(Codepoint.iterate_numeric_codepoints())
+        >>> numerals[:3]
+        [Codepoint(0x0030), Codepoint(0x0031), Codepoint(0x0032)]
+        >>> all(cp.numeric_type for cp in numerals)
+        True
+        """
+        import numpy as np
+
+        numeric_table = np.frombuffer(_numeric_table, dtype=np.int8)
+        numeric = np.flatnonzero(numeric_table != NOT_NUMERIC)
+        return map(Codepoint.get, numeric.tolist())
+
+    @staticmethod
+    def get(codepoint: int) -> "Codepoint":
+        """
+        Like Codepoint(codepoint), but reuses the same instance for BMP code points.
+
+        Code points outside of the BMP are not cached: there are a million of them,
+        and they are rarely asked for twice.
+
+        >>> Codepoint.get(0x09EA) is Codepoint.get(0x09EA)
+        True
+        >>> Codepoint.get(0x1D2E0)
+        Codepoint(0x1D2E0)
+        """
+        if 0 <= codepoint <= Codepoint.MAX_BMP_CODE_POINT:
+            cached = Codepoint._bmp_cache[codepoint]
+            if cached is None:
+                cached = Codepoint._bmp_cache[codepoint] = Codepoint(codepoint)
+            return cached
+
+        return Codepoint(codepoint)
+
+    @staticmethod
+    def find_all_with_numeric_type(numeric_type):
+        """
+        Returns every code point with the given Numeric_Type, as a NumPy array.
+
+        >>> Codepoint.find_all_with_numeric_type("Decimal")[:10]
+        array([48, 49, 50, 51, 52, 53, 54, 55, 56, 57])
+        """
+        return _properties.numeric_type.find_all(numeric_type)
+
+
+# Property lookups by code point, for bulk scans that do not need Codepoint objects:
+
+
+def name(codepoint: int) -> str:
+    return _properties.name[codepoint]
+
+
+def general_category(codepoint: int) -> str:
+    return _properties.general_category[codepoint]
+
+
+def script(codepoint: int) -> str:
+    return _properties.script[codepoint]
+
+
+def script_id(codepoint: int) -> int:
+    """
+    Like script(), but returns a small integer ID instead of the script's name.
+    script_names() maps the ID back to the name.
+
+    >>> script_names()[script_id(ord('৪'))]
+    'Bengali'
+    """
+    return _properties.script.value_id(codepoint)
+
+
+def script_names() -> tuple:
+    return _properties.script.values
+
+
+def numeric_type(codepoint: int):
+    """
+    >>> "".join(chr(cp) for cp in range(0x80) if numeric_type(cp) == "Decimal")
+    '0123456789'
+    """
+    return _properties.numeric_type[codepoint]
+
+
+def numeric_type_id(codepoint: int) -> int:
+    """
+    Like numeric_type(), but returns a NumericType integer instead of a string.
+
+    >>> numeric_type_id(ord('৪')) == NumericType.DECIMAL
+    True
+    """
+    return _properties.numeric_type.value_id(codepoint)
+
+
+def numeric_value(codepoint: int):
+    """
+    Integer values are ints, and rational values are floats. Use as_fraction() to get
+    a rational value exactly.
+
+    >>> numeric_value(ord('৪'))
+    4
+    >>> numeric_value(0x2153), as_fraction(numeric_value(0x2153))
+    (0.3333333333333333, Fraction(1, 3))
+    """
+    return _properties.numeric_value[codepoint]
+
+
+def bidirectional_class(codepoint: int) -> str:
+    return _properties.bidi_class[codepoint]
+
+
+def decomposition(codepoint: int) -> str:
+    return _properties.decomposition[codepoint]
 
 
 _properties = parse_ucd.parse_all()
+# Used by every to_decimal(), to_digit() and to_numeric() call:
+_numeric_table = _properties.numeric_table
+_numeric_extra = _properties.numeric_extra
+# Codepoint.__init__() rejects bad code points, so its properties skip bounds checks:
+_general_category_of = _properties.general_category.compile()
+_script_of = _properties.script.compile()
+_bidi_class_of = _properties.bidi_class.compile()
+_numeric_type_of = _properties.numeric_type.compile()
+_numeric_value_of = _properties.numeric_value.compile()
+_decomposition_of = _properties.decomposition.compile()
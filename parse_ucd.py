@@ -4,15 +4,30 @@ Parses files from the Unicode property database
 See: http://www.unicode.org/reports/tr44/#Format_Conventions
 """
 
+import glob
+import hashlib
+import marshal
+import os
+import re
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from enum import IntEnum
 from fractions import Fraction
 from math import nan
+from operator import itemgetter
 from types import SimpleNamespace
-from typing import Any, NamedTuple
+from typing import NamedTuple
 
 ###################################### Constants #######################################
 
+UCD_FILES = ("./UnicodeData.txt", "./Scripts.txt")
+CACHE_PATH_TEMPLATE = "./ucd_cache.{python}.{digest}.marshal"
+
 CODE_POINT_MIN = 0
 CODE_POINT_MAX = 0x10FFFF
+LATIN_1_SIZE = 0x100
 
 # https://www.unicode.org/reports/tr44/#UnicodeData.txt
 NAME = 1
@@ -26,6 +41,40 @@ BIDI_MIRRORED = 9
 # https://www.unicode.org/reports/tr24/#Data_File_SC
 SCRIPT = 1
 
+# A data line starts with a code point or a range, and has at least one more field
+# before the optional comment. Blank lines and comment lines do not match.
+DATA_LINE = re.compile(r"\s*(([0-9A-Fa-f]+)(?:\.\.([0-9A-Fa-f]+))?)\s*;([^#\n]*)")
+
+# Two-stage lookup tables split a code point into a block number and an offset.
+# 256-code point blocks make the smallest tables for the UCD:
+BLOCK_SHIFT = 8
+BLOCK_SIZE = 1 << BLOCK_SHIFT
+BLOCK_MASK = BLOCK_SIZE - 1
+
+# The packed numeric table stores Decimal values as is, Digit values offset by
+# DIGIT_OFFSET, and everything else as one of these negative codes:
+NOT_NUMERIC = -1
+NUMERIC_EXTRA = -2
+DIGIT_OFFSET = 16
+
+# Larger than any denominator of a rational Numeric_Value; see as_fraction():
+MAX_NUMERIC_DENOMINATOR = 1_000
+
+
+class NumericType(IntEnum):
+    """
+    Value IDs of the Numeric_Type property in the _numeric_type lookup.
+    """
+
+    NONE = 0
+    DECIMAL = 1
+    DIGIT = 2
+    NUMERIC = 3
+
+
+# The Numeric_Type property values, in NumericType order (NONE is the default):
+NUMERIC_TYPE_VALUES = ("Decimal", "Digit", "Numeric")
+
 ###################################### Sentinels #######################################
 UsesNameRule = object()
 
@@ -34,6 +83,9 @@ class CodepointRange(NamedTuple):
     """
     Represents a range of code points from a Unicode Character Database file.
     Ranges are INCLUSIVE on both sides!
+
+    This is only what parse_line() returns. Anything that takes a range also accepts
+    a plain (start, end_inclusive) tuple, and PropertyLookup stores plain ints.
     """
 
     start: int
@@ -68,205 +120,504 @@ class PropertyLookup:
     """
     Enables lookups of Unicode character properties using a sparse data structure with
     defaults for missing entries.
-    """
 
-    def __init__(self, *, default):
-        self._table = []
-        self._default = default
+    Ranges are added in code point order with extend_last(). Once all ranges are added,
+    finalize() compiles them into a two-stage table, so that every lookup is just two
+    array indexes, no matter how many ranges there are. Before that, lookups fall back
+    to a binary search over the stored ranges.
 
-        # Cache results when iterating sequentially throuh properties:
-        self._previous_record = InvalidPropertyRecord()
-        self._previous_index = None
+    >>> digits = PropertyLookup(default=None)
+    >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+    >>> digits[ord('0')], digits[ord('9')], digits[ord('a')]
+    ('Decimal', 'Decimal', None)
+    """
 
-    def extend_last(self, code_point_range: CodepointRange, value):
-        try:
-            last_start, last_end, previous_value = self._table[-1]
-        except IndexError:
-            self._table.append(PropertyRecord.from_range(code_point_range, value))
-            return
+    def __init__(self, *, default, values=()):
+        # The stored ranges, as parallel columns. Values are stored by their ID:
+        self._starts = array("i")
+        self._ends = array("i")
+        self._range_value_ids = array("I")
+
+        # Every distinct value, indexed by its ID. The default always has ID 0, and
+        # the given values get the IDs after it, in order:
+        self._values = [default, *values]
+        self._value_ids = {
+            value: value_id for value_id, value in enumerate(self._values)
+        }
+
+        # The two-stage table, built by finalize():
+        self._stage1 = None
+        self._stage2 = None
+        # ASCII and Latin-1 are looked up so often that they get their own table:
+        self._latin_1 = None
+        # The values property, frozen by finalize() so that it is not copied per call:
+        self._values_tuple = None
+
+    def extend_last(self, code_point_range: tuple[int, int], value):
+        start, end = code_point_range
+
+        value_id = self._value_ids.get(value)
+        if value_id is None:
+            # Only the stored copy needs to be interned: every lookup returns it, and
+            # later equal values find its ID through the dict above.
+            value = intern_if_str(value)
+            value_id = self._value_ids[value] = len(self._values)
+            self._values.append(value)
+
+        if self._starts:
+            assert start > self._ends[-1]
+
+            if start == self._ends[-1] + 1 and value_id == self._range_value_ids[-1]:
+                # We can extend the previous range.
+                self._ends[-1] = end
+                return
+
+        self._starts.append(start)
+        self._ends.append(end)
+        self._range_value_ids.append(value_id)
+
+    def ranges(self):
+        """
+        Yields every stored range as (start, end_inclusive, value), in order.
+        """
+        values = self._values
+        for start, end, value_id in zip(
+            self._starts, self._ends, self._range_value_ids
+        ):
+            yield start, end, values[value_id]
 
-        assert code_point_range.start > last_end
+    def finalize(self):
+        """
+        Compiles the stored ranges into a two-stage lookup table.
+
+        The code point space is split into blocks of BLOCK_SIZE code points; stage2
+        stores the value IDs of every distinct block, and stage1 stores where each block
+        starts in stage2.
+
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.finalize()
+        >>> digits[ord('0')], digits[ord('9')], digits[ord('a')], digits[CODE_POINT_MAX]
+        ('Decimal', 'Decimal', None, None)
+        >>> digits._range_value_ids.typecode
+        'B'
+        """
+        values = self._values
+        typecode = smallest_unsigned_typecode(len(values) - 1)
+        empty_block = array(typecode, [0]) * BLOCK_SIZE
+
+        starts, ends, value_ids = self._starts, self._ends, self._range_value_ids
+        n_ranges = len(starts)
+
+        stage1 = []
+        stage2 = array(typecode)
+        block_offsets = {}
+        for block_start in range(CODE_POINT_MIN, CODE_POINT_MAX + 1, BLOCK_SIZE):
+            block_end = block_start + BLOCK_SIZE - 1
+            block = empty_block[:]
+
+            # Ranges are sorted and disjoint, so the ends are sorted too. Find the
+            # first range that ends in this block or later:
+            index = bisect_left(ends, block_start)
+            while index < n_ranges and starts[index] <= block_end:
+                start = max(starts[index], block_start) - block_start
+                end = min(ends[index], block_end) - block_start
+                value_id = value_ids[index]
+                block[start : end + 1] = array(typecode, [value_id]) * (end - start + 1)
+                index += 1
+
+            # Only store each distinct block once:
+            block_bytes = block.tobytes()
+            if block_bytes not in block_offsets:
+                block_offsets[block_bytes] = len(stage2)
+                stage2.extend(block)
+            stage1.append(block_offsets[block_bytes])
+
+        self._stage1 = array(smallest_unsigned_typecode(len(stage2)), stage1)
+        self._stage2 = stage2
+        # No more ranges are added after this, so most lookups (like Script, with
+        # ~160 values) can store their ranges' value IDs in one byte each:
+        self._range_value_ids = array(typecode, self._range_value_ids)
+        self._latin_1 = self._build_latin_1()
+        self._values_tuple = tuple(values)
+
+    def _build_latin_1(self) -> list:
+        stage1, stage2, values = self._stage1, self._stage2, self._values
+        return [
+            values[stage2[stage1[cp >> BLOCK_SHIFT] + (cp & BLOCK_MASK)]]
+            for cp in range(LATIN_1_SIZE)
+        ]
 
-        if code_point_range.start == last_end + 1 and value == previous_value:
-            # We can extend the previous range.
-            self._table[-1] = PropertyRecord(
-                last_start, code_point_range.end_inclusive, value
-            )
-        else:
-            self._table.append(PropertyRecord.from_range(code_point_range, value))
+    # The constants are bound as defaults, so that every lookup reads fast locals
+    # instead of globals:
+    def __getitem__(
+        self,
+        codepoint: int,
+        latin_1_size=LATIN_1_SIZE,
+        block_shift=BLOCK_SHIFT,
+        block_mask=BLOCK_MASK,
+    ):
+        try:
+            if 0 <= codepoint < latin_1_size:
+                return self._latin_1[codepoint]
+
+            if codepoint < CODE_POINT_MIN or codepoint > CODE_POINT_MAX:
+                raise IndexError(codepoint)
+
+            offset = self._stage1[codepoint >> block_shift] + (codepoint & block_mask)
+            return self._values[self._stage2[offset]]
+        except TypeError:
+            # The tables are None until finalize() is called. Catching that here is
+            # cheaper than checking for it on every lookup:
+            if self._stage1 is not None:
+                raise
+            return self._find_in_ranges(codepoint)
+
+    def _find_in_ranges(self, codepoint: int):
+        index = bisect_right(self._starts, codepoint) - 1
+        if index >= 0 and codepoint <= self._ends[index]:
+            return self._values[self._range_value_ids[index]]
+        return self._values[0]
+
+    def value_id(self, codepoint: int) -> int:
+        """
+        Returns the small integer ID of the code point's value, without looking up the
+        value itself. The default value always has ID 0.
 
-    def __getitem__(self, codepoint: int):
+        >>> numeric_type = PropertyLookup(default=None, values=NUMERIC_TYPE_VALUES)
+        >>> numeric_type.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> numeric_type.finalize()
+        >>> numeric_type.value_id(ord('4')) == NumericType.DECIMAL
+        True
+        >>> numeric_type.value_id(ord('a')) == NumericType.NONE
+        True
+        """
         if codepoint < CODE_POINT_MIN or codepoint > CODE_POINT_MAX:
             raise IndexError(codepoint)
 
-        return self._find(codepoint)
-
-    def _find(self, codepoint: int):
-        record = self._previous_record
+        offset = self._stage1[codepoint >> BLOCK_SHIFT] + (codepoint & BLOCK_MASK)
+        return self._stage2[offset]
 
-        if record.contains(codepoint):
-            # Sequential access AND we're in the same range!
-            return record.value
+    def compile(self):
+        """
+        Returns a plain function that looks up the value of a code point in the
+        finalized tables. It skips the Latin-1 list and the bounds check, so only call
+        it with code points that are already known to be valid.
+
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.finalize()
+        >>> lookup = digits.compile()
+        >>> lookup(ord('4')), lookup(ord('a')), lookup(CODE_POINT_MAX)
+        ('Decimal', None, None)
+        """
+        assert self._stage1 is not None, "call finalize() first"
+
+        stage1, stage2, values = self._stage1, self._stage2, self._values_tuple
+
+        # The tables are bound as defaults so that every lookup only reads fast locals,
+        # instead of going through self and the special method lookup of self[...]:
+        def lookup(
+            codepoint,
+            stage1=stage1,
+            stage2=stage2,
+            values=values,
+            block_shift=BLOCK_SHIFT,
+            block_mask=BLOCK_MASK,
+        ):
+            return values[
+                stage2[stage1[codepoint >> block_shift] + (codepoint & block_mask)]
+            ]
+
+        return lookup
 
-        if record.directly_before(codepoint):
-            # Sequential access! We just want the NEXT range, if it exists.
-            try:
-                record = self._table[self._previous_index + 1]
-            except IndexError:
-                # After the end of stored records. Must create a fake record
-                pass
-            else:
-                if record.contains(codepoint):
-                    # The next range EXISTS, so cache it!
-                    self._previous_record = record
-                    self._previous_index += 1
-                    return record.value
+    @property
+    def values(self) -> tuple:
+        """
+        All distinct values, indexed by value ID.
+
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.values
+        (None, 'Decimal')
+        >>> digits.finalize()
+        >>> digits.values is digits.values
+        True
+        """
+        if self._values_tuple is None:
+            # Values can still be added until finalize():
+            return tuple(self._values)
+        return self._values_tuple
 
-        # Not a simple sequential access, so we have to search:
-        record, index = self._find_with_binary_search(codepoint)
-        self._previous_record = record
-        self._previous_index = index
+    def to_marshal(self) -> dict:
+        """
+        Returns the finalized tables using only types that marshal supports. Use
+        from_marshal() to get the lookup back.
+
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.finalize()
+        >>> state = marshal.loads(marshal.dumps(digits.to_marshal()))
+        >>> copy = PropertyLookup.from_marshal(state)
+        >>> copy[ord('4')], copy[ord('a')], copy[CODE_POINT_MAX]
+        ('Decimal', None, None)
+        """
+        assert self._stage1 is not None, "call finalize() first"
 
-        return record.value
+        # marshal can't store NotImplemented (see add_name()), so remember where it was:
+        values = list(self._values)
+        not_implemented = [
+            i for i, value in enumerate(values) if value is NotImplemented
+        ]
+        for value_id in not_implemented:
+            values[value_id] = None
+
+        return {
+            "values": values,
+            "not_implemented": not_implemented,
+            "starts": array_to_marshal(self._starts),
+            "ends": array_to_marshal(self._ends),
+            "range_value_ids": array_to_marshal(self._range_value_ids),
+            "stage1": array_to_marshal(self._stage1),
+            "stage2": array_to_marshal(self._stage2),
+        }
 
-    def _find_with_binary_search(self, codepoint: int):
-        table = self._table
+    @classmethod
+    def from_marshal(cls, state: dict):
+        lookup = cls.__new__(cls)
+
+        # marshal keeps interned strings interned, so there's no need to intern again:
+        values = state["values"]
+        for value_id in state["not_implemented"]:
+            values[value_id] = NotImplemented
+        lookup._values = values
+        lookup._value_ids = dict(zip(values, range(len(values))))
+
+        lookup._starts = array_from_marshal(state["starts"])
+        lookup._ends = array_from_marshal(state["ends"])
+        lookup._range_value_ids = array_from_marshal(state["range_value_ids"])
+        lookup._stage1 = array_from_marshal(state["stage1"])
+        lookup._stage2 = array_from_marshal(state["stage2"])
+        lookup._latin_1 = lookup._build_latin_1()
+        lookup._values_tuple = tuple(values)
+        return lookup
+
+    def lookup_many(self, codepoints):
+        """
+        Looks up a whole NumPy array of code points at once, and returns their values
+        as a NumPy object array. Requires NumPy, and a finalized lookup.
+
+        >>> import numpy as np
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.finalize()
+        >>> digits.lookup_many(np.array([0x0030, 0x0061, 0x0669]))
+        array(['Decimal', None, None], dtype=object)
+        >>> digits.lookup_many([])
+        array([], dtype=object)
+        """
+        import numpy as np
 
-        def binary_search(start, end):
-            if start >= end:
-                # Could not find a record!
-                return self._create_fake_record(codepoint, start)
+        values = np.empty(len(self._values), dtype=object)
+        values[:] = self._values
+        # An empty list would otherwise become a float array, which can't be shifted:
+        return values[self._value_ids_many(np.asarray(codepoints, dtype=np.intp))]
 
-            midpoint = start + ((end - start) // 2)
-            record = table[midpoint]
+    def find_all(self, value):
+        """
+        Returns every code point whose value is value, as a NumPy array.
+
+        The whole two-stage table is expanded and compared in one vectorized pass, so
+        this is much faster than looking up every code point. Requires NumPy.
+
+        >>> digits = PropertyLookup(default=None)
+        >>> digits.extend_last(CodepointRange(0x0030, 0x0039), "Decimal")
+        >>> digits.finalize()
+        >>> digits.find_all("Decimal")
+        array([48, 49, 50, 51, 52, 53, 54, 55, 56, 57])
+        >>> digits.find_all("Numeric")
+        array([], dtype=int64)
+        """
+        import numpy as np
 
-            if record.contains(codepoint):
-                return record, midpoint
-            elif codepoint < record.start:
-                return binary_search(start, midpoint)
-            elif codepoint > record.end_inclusive:
-                return binary_search(midpoint + 1, end)
+        try:
+            value_id = self._values.index(value)
+        except ValueError:
+            return np.array([], dtype=np.int64)
 
-        return binary_search(0, len(table))
+        all_codepoints = np.arange(CODE_POINT_MIN, CODE_POINT_MAX + 1)
+        return np.flatnonzero(self._value_ids_many(all_codepoints) == value_id)
 
-    def _create_fake_record(self, codepoint: int, index: int):
+    def _value_ids_many(self, codepoints):
         """
-        Returns a synthesized PropertyRecord that is not actually stored.
-
-        Should only be called with the index to the NEXT stored entry.
+        The vectorized version of value_id().
         """
+        import numpy as np
 
-        # Assume these are the store records:
-        #
-        # [
-        #     # start  end  value
-        #     (    31,  31, 'X'),  # index 0
-        #     (    65,  90, 'X'),  # index 1
-        # ]
-        #
-        # We synthesize a record by looking at the neighbours of the failed binary
-        # search.
-        #
-        # Example:
-        # Binary search failed looking for a value for 48. It will fail at index 1.
-        #
-        #   codepoint = 48
-        #   index = 1
-        #
-        # We create a fake record by looking at its neighbours:
-        #
-        # [
-        #     # start  end  value
-        #     (    31,  31, 'X'), # index 0
-        #                          <- (32, 64, 'Default')
-        #     (    65,  90, 'X'), # index 1
-        # ]
-
-        if index > 0:
-            # The fake entry must start after the PREVIOUS stored entry.
-            fake_start = self._table[index - 1].end_inclusive + 1
-        else:
-            fake_start = CODE_POINT_MIN
-
-        try:
-            # The fake entry must end before the CURRENT stored entry.
-            fake_end = self._table[index].start - 1
-        except IndexError:
-            fake_end = CODE_POINT_MAX
+        if codepoints.size and (
+            codepoints.min() < CODE_POINT_MIN or codepoints.max() > CODE_POINT_MAX
+        ):
+            raise IndexError("code point out of range")
 
-        assert fake_start <= codepoint <= fake_end
-
-        return PropertyRecord(fake_start, fake_end, self._default), index
+        stage1 = np.frombuffer(self._stage1, dtype=self._stage1.typecode)
+        stage2 = np.frombuffer(self._stage2, dtype=self._stage2.typecode)
+        offsets = stage1[codepoints >> BLOCK_SHIFT].astype(np.intp)
+        return stage2[offsets + (codepoints & BLOCK_MASK)]
 
     def __len__(self) -> int:
-        return len(self._table)
+        return len(self._starts)
 
 
-class PropertyRecord(NamedTuple):
+class NamePropertyLookup(PropertyLookup):
     """
-    An entry in the PropertyLookup table.
+    Specialized property lookup for the Name property.
+
+    Some of the values here are algorithmically generated.
     """
 
-    start: int
-    end_inclusive: int
-    value: Any
+    def __getitem__(self, codepoint: int) -> str:
+        name = super().__getitem__(codepoint)
+        if name is UsesNameRule:
+            raise NotImplementedError(f"need to generate name for U+{codepoint:04X}")
+        return name
 
-    contains = CodepointRange.contains
 
-    def directly_before(self, codepoint: int) -> bool:
-        return self.end_inclusive + 1 == codepoint
+# https://www.unicode.org/reports/tr44/#Default_Values_Table
+_general_category = PropertyLookup(default="Cc")
+_name = NamePropertyLookup(default="")
+_decomposition = PropertyLookup(default="")
+_numeric_type = PropertyLookup(default=None, values=NUMERIC_TYPE_VALUES)
+_numeric_value = PropertyLookup(default=nan)
+_script = PropertyLookup(default="Unknown")
+# Copied from Python's unicodedata, which returns "" for unassigned code points:
+_bidi_class = PropertyLookup(default="")
 
-    @classmethod
-    def from_range(cls, r: CodepointRange, value: Any):
-        start, end = r
-        return cls(start, end, value)
+# Numeric_Type and Numeric_Value packed into one byte per code point, plus the float
+# value of every Numeric that does not fit. Only allocated by pack_numeric_properties(),
+# since a cache hit never needs the empty 1.1 MB table:
+_numeric_table = None
+_numeric_extra = {}
 
 
-class InvalidPropertyRecord:
+def parse_all():
     """
-    Sentinel value
+    Returns all of the properties, parsed from the UCD files.
+
+    Parsing is slow, so the parsed properties are cached in a marshal file next to the
+    UCD files. The cache is keyed on the contents of the UCD files and of this module,
+    so it is rebuilt whenever either changes (see hash_sources()). To build the cache
+    ahead of time, run:
+
+        python3 parse_ucd.py --build
     """
+    cache_path = get_cache_path(hash_sources())
 
-    def contains(self, codepoint: int) -> bool:
-        return False
+    try:
+        with open(cache_path, "rb") as cache_file:
+            # marshal.load() reads a file in many small pieces; loads() is much faster:
+            properties = properties_from_marshal(marshal.loads(cache_file.read()))
+    except (OSError, EOFError, ValueError, KeyError, TypeError):
+        # Missing, unreadable, truncated or otherwise corrupt: just parse again.
+        pass
+    else:
+        use_properties(properties)
+        return properties
 
-    def directly_before(self, codepoint: int) -> bool:
-        return False
+    properties = parse_all_uncached()
+    try:
+        write_cache(cache_path, properties)
+    except OSError:
+        # e.g., a read-only checkout. The properties are fine, just not cached.
+        pass
+    return properties
 
-    def _raise(self):
-        raise AssertionError("Should not access property of InvalidPropertyRecord")
 
-    start = property(_raise)
-    end_inclusive = property(_raise)
-    value = property(_raise)
+def use_properties(properties: SimpleNamespace):
+    """
+    Points the module-level lookups at properties loaded from the cache, so that they
+    agree with what parse_all() returns.
+    """
+    global _general_category, _name, _decomposition, _numeric_type, _numeric_value
+    global _script, _bidi_class, _numeric_table, _numeric_extra
+
+    _general_category = properties.general_category
+    _name = properties.name
+    _decomposition = properties.decomposition
+    _numeric_type = properties.numeric_type
+    _numeric_value = properties.numeric_value
+    _script = properties.script
+    _bidi_class = properties.bidi_class
+    _numeric_table = properties.numeric_table
+    _numeric_extra = properties.numeric_extra
+
+
+def write_cache(cache_path: str, properties: SimpleNamespace):
+    # Write to a temporary file first, so a concurrent process never sees a
+    # partially-written cache:
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            marshal.dump(properties_to_marshal(properties), cache_file)
+        os.replace(temporary_path, cache_path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+
+    # Every change to the sources leaves a cache behind, so clean up the old ones. Only
+    # for this Python, though: other versions' caches are probably still in use.
+    for stale_path in glob.glob(get_cache_path("*")):
+        if stale_path != cache_path:
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
 
 
-class NamePropertyLookup(PropertyLookup):
+def get_cache_path(digest: str) -> str:
     """
-    Specialized property lookup for the Name property.
+    Returns the path of the cache for the given digest of the sources.
 
-    Some of the values here are algorithmically generated.
+    The marshal format can change between Python versions, so each version gets its
+    own caches, which are named after it.
     """
+    major, minor = sys.version_info[:2]
+    python = f"py{major}.{minor}-marshal{marshal.version}"
+    return CACHE_PATH_TEMPLATE.format(python=python, digest=digest)
 
-    def __getitem__(self, codepoint: int) -> str:
-        name = super().__getitem__(codepoint)
-        if name is UsesNameRule:
-            raise NotImplementedError(f"need to generate name for U+{codepoint:04X}")
-        return name
 
+def properties_to_marshal(properties: SimpleNamespace) -> dict:
+    state = {
+        field: value.to_marshal()
+        for field, value in vars(properties).items()
+        if isinstance(value, PropertyLookup)
+    }
+    state["numeric_table"] = array_to_marshal(properties.numeric_table)
+    state["numeric_extra"] = properties.numeric_extra
+    return state
 
-# https://www.unicode.org/reports/tr44/#Default_Values_Table
-_general_category = PropertyLookup(default="Cc")
-_name = NamePropertyLookup(default="")
-_decomposition = PropertyLookup(default="")
-_numeric_type = PropertyLookup(default=None)
-_numeric_value = PropertyLookup(default=nan)
-_script = PropertyLookup(default="Unknown")
+
+def properties_from_marshal(state: dict) -> SimpleNamespace:
+    return SimpleNamespace(
+        general_category=PropertyLookup.from_marshal(state["general_category"]),
+        name=NamePropertyLookup.from_marshal(state["name"]),
+        decomposition=PropertyLookup.from_marshal(state["decomposition"]),
+        numeric_type=PropertyLookup.from_marshal(state["numeric_type"]),
+        numeric_value=PropertyLookup.from_marshal(state["numeric_value"]),
+        numeric_table=array_from_marshal(state["numeric_table"]),
+        numeric_extra=state["numeric_extra"],
+        script=PropertyLookup.from_marshal(state["script"]),
+        bidi_class=PropertyLookup.from_marshal(state["bidi_class"]),
+    )
 
 
-def parse_all():
+def parse_all_uncached():
     parse_unicode_data()
     parse_scripts()
+    load_bidi_classes()
+    pack_numeric_properties()
 
     return SimpleNamespace(
         general_category=_general_category,
@@ -274,10 +625,25 @@ def parse_all():
         decomposition=_decomposition,
         numeric_type=_numeric_type,
         numeric_value=_numeric_value,
+        numeric_table=_numeric_table,
+        numeric_extra=_numeric_extra,
         script=_script,
+        bidi_class=_bidi_class,
     )
 
 
+def hash_sources() -> str:
+    """
+    Returns a short digest of the UCD files, this module's source code, and the
+    version of Python's unicodedata.
+    """
+    digest = hashlib.blake2b(unicodedata.unidata_version.encode("UTF-8"))
+    for filename in (*UCD_FILES, __file__):
+        with open(filename, "rb") as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()[:16]
+
+
 def parse_unicode_data():
     """
     >>> parse_unicode_data()
@@ -307,7 +673,7 @@ def parse_unicode_data():
     >>> _numeric_type[0x2155]
     'Numeric'
     >>> _numeric_value[0x2155]
-    Fraction(1, 5)
+    0.2
 
     >>> _numeric_value[0x1D2E0]
     0
@@ -323,8 +689,21 @@ def parse_unicode_data():
     >>> _decomposition[0x01A1]
     '006F 031B'
     """
-    with open("./UnicodeData.txt", encoding="UTF-8") as data_file:
-        return parse_unicode_data_lines(iter(data_file))
+    # UnicodeData.txt is pure ASCII, so decode it in one go instead of going through
+    # the line-by-line UTF-8 text layer:
+    with open("./UnicodeData.txt", "rb") as data_file:
+        lines = data_file.read().decode("ascii").split("\n")
+
+    parse_unicode_data_lines(lines)
+
+    for lookup in (
+        _general_category,
+        _name,
+        _decomposition,
+        _numeric_type,
+        _numeric_value,
+    ):
+        lookup.finalize()
 
 
 def parse_scripts():
@@ -348,14 +727,54 @@ def parse_scripts():
     with open("./Scripts.txt", encoding="UTF-8") as data_file:
         # Scripts.txt is ordered BY SCRIPT, and not BY CODE POINT.
         # Slurp all the data first, then sort it to insert ordered into the
-        # PropertyLookup
-        ordered_lines = [
-            result for line in data_file if (result := parse_line(line)) is not None
+        # PropertyLookup. Only keep (start, end, script), so that sorting compares
+        # plain ints instead of CodepointRanges and field lists:
+        ordered_ranges = [
+            (*result[0], result[1][SCRIPT])
+            for line in data_file
+            if (result := parse_line(line)) is not None
         ]
-        ordered_lines.sort()
 
-        for code_point_range, fields in ordered_lines:
-            _script.extend_last(code_point_range, fields[SCRIPT])
+    # Each script's lines are already in code point order, and Timsort merges those
+    # runs in C. (That is ~20x faster than a heapq.merge() of per-script lists.)
+    ordered_ranges.sort(key=itemgetter(0))
+
+    for start, end, script in ordered_ranges:
+        _script.extend_last((start, end), script)
+
+    _script.finalize()
+
+
+def load_bidi_classes():
+    """
+    Copies the Bidi_Class of every code point from Python's built-in unicodedata,
+    so that it can be looked up (and cached) like the other properties.
+
+    I'd love to parse it from the UCD, but it requires parsing YET ANOTHER file,
+    which I don't feel like doing 😇
+
+    >>> load_bidi_classes()
+    >>> _bidi_class[ord('a')]
+    'L'
+    >>> _bidi_class[ord('1')]
+    'EN'
+    >>> _bidi_class[0x0641]
+    'AL'
+    >>> _bidi_class[0x0378]
+    ''
+    """
+    bidirectional = unicodedata.bidirectional
+
+    run_start = CODE_POINT_MIN
+    run_value = bidirectional(chr(run_start))
+    for codepoint in range(CODE_POINT_MIN + 1, CODE_POINT_MAX + 1):
+        value = bidirectional(chr(codepoint))
+        if value != run_value:
+            _bidi_class.extend_last((run_start, codepoint - 1), run_value)
+            run_start, run_value = codepoint, value
+    _bidi_class.extend_last((run_start, CODE_POINT_MAX), run_value)
+
+    _bidi_class.finalize()
 
 
 def parse_line(line: str):
@@ -365,31 +784,33 @@ def parse_line(line: str):
     See: http://www.unicode.org/reports/tr44/#Format_Conventions
 
     >>> parse_line("\n")
+    >>> parse_line("")
     >>> parse_line("# I'm a comment\n")
     >>> parse_line("0020          ; Common # Zs       SPACE")
     (CodepointRange(start=32, end_inclusive=32), ['0020', 'Common'])
     >>> parse_line("1D2E0..1D2F3  ; Common # No  [20] MAYAN NUMERAL ZERO..MAYAN NUMERAL NINETEEN")
     (CodepointRange(start=119520, end_inclusive=119539), ['1D2E0..1D2F3', 'Common'])
+    >>> parse_line("00BD          ; No ; 1/2 # ONE HALF")
+    (CodepointRange(start=189, end_inclusive=189), ['00BD', 'No', '1/2'])
+    >>> parse_line("00bd ; No")
+    (CodepointRange(start=189, end_inclusive=189), ['00bd', 'No'])
+    >>> parse_line("NOT A CODE POINT ; No")
+    Traceback (most recent call last):
+      ...
+    ValueError: not a UCD data line: 'NOT A CODE POINT ; No'
     """
 
-    line = line.rstrip("\n")
-    content, _, _comment = line.partition("#")
-
-    if content == "":
-        return None
-
-    # "Each line of data consists of fields separated by semicolons."
-    # "Leading and trailing spaces within a field are not significant."
-    # From: http://www.unicode.org/reports/tr44/#Data_Fields
-    fields = [field.strip() for field in content.split(";")]
-    assert len(fields) >= 2, f"Did not find enough fields in line: {line!r}"
-
-    range_expression = fields[0]
+    match = DATA_LINE.match(line)
+    if match is None:
+        # Only blank lines and comments may not match:
+        if line.strip() == "" or line.lstrip().startswith("#"):
+            return None
+        raise ValueError(f"not a UCD data line: {line!r}")
 
-    start_hex, range_marker, end_hex = range_expression.partition("..")
+    range_expression, start_hex, end_hex, other_fields = match.groups()
     start = int(start_hex, base=16)
 
-    if range_marker:
+    if end_hex:
         # Found a range like 0030..0039:
         end = int(end_hex, base=16)
         code_point_range = CodepointRange(start, end)
@@ -397,47 +818,93 @@ def parse_line(line: str):
         # Found a single codepoint.
         code_point_range = CodepointRange(start, start)
 
+    # "Each line of data consists of fields separated by semicolons."
+    # "Leading and trailing spaces within a field are not significant."
+    # From: http://www.unicode.org/reports/tr44/#Data_Fields
+    if ";" not in other_fields:
+        # Files like Scripts.txt only have one property per line, so skip the loop:
+        return code_point_range, [range_expression, other_fields.strip()]
+
+    fields = [field.strip() for field in other_fields.split(";")]
+    fields.insert(0, range_expression)
+
     return code_point_range, fields
 
 
+def parse_unicode_data_line(line: str):
+    """
+    A faster parse_line() for UnicodeData.txt, which has no comments, no spaces
+    around its fields, and one code point per line. Returns the code point itself
+    instead of a CodepointRange.
+
+    >>> line = "0030;DIGIT ZERO;Nd;0;EN;;0;0;0;N;;;;;"
+    >>> codepoint, fields = parse_unicode_data_line(line)
+    >>> codepoint
+    48
+    >>> fields[NAME], fields[GENERAL_CATEGORY], fields[NUMERICAL_VALUE_DECIMAL]
+    ('DIGIT ZERO', 'Nd', '0')
+    """
+    fields = line.split(";")
+    return int(fields[0], base=16), fields
+
+
 def parse_unicode_data_lines(lines):
-    while line := next_or_none(lines):
-        result = parse_line(line)
-        if result is None:
+    # The first line of an implied range, while waiting for its last line:
+    pending_first = None
+
+    for line in lines:
+        if not line:
             continue
 
-        code_point_range, fields = result
-        assert code_point_range.is_single_code_point
-        codepoint, _ = code_point_range
+        if pending_first is not None:
+            start, first_fields = pending_first
+            pending_first = None
+
+            # The "Last>" line repeats everything but the code point and the name, so
+            # only its leading code point needs to be parsed:
+            last_hex, _, rest = line.partition(";")
+            codepoint = int(last_hex, base=16)
+            last_name, _, tail = rest.partition(";")
+            assert start < codepoint
+            assert ends_implied_range(last_name)
+            assert ";".join(first_fields[2:]) == tail
+
+            code_point_range = (start, codepoint)
+            fields = first_fields
+        else:
+            codepoint, fields = parse_unicode_data_line(line)
 
-        raw_name = fields[NAME]
+            if starts_implied_range(fields[NAME]):
+                # Implied ranges span two lines, and are indicated by the NAME field:
+                pending_first = (codepoint, fields)
+                continue
 
-        if starts_implied_range(raw_name):
-            # Implied ranges are split on two lines and are indicated by the NAME field.
-            next_range, next_fields = parse_line(next(lines))
-            assert next_range.is_single_code_point
-            end_codepoint, _ = next_range
-            assert codepoint < end_codepoint
-            assert ends_implied_range(next_fields[NAME])
-            assert fields[2:] == next_fields[2:]
+            # There is a row for every code point, so use plain tuples instead of
+            # CodepointRange; extend_last() only needs (start, end_inclusive):
+            code_point_range = (codepoint, codepoint)
 
-            code_point_range = CodepointRange(codepoint, end_codepoint)
+        raw_name = fields[NAME]
 
         _general_category.extend_last(code_point_range, fields[GENERAL_CATEGORY])
         add_name(code_point_range, raw_name)
-        add_numeral(
-            code_point_range,
-            *fields[NUMERICAL_VALUE_DECIMAL : NUMERICAL_VALUE_NUMERIC + 1],
-        )
+        # Only a few percent of rows have a numeric value; don't bother with the rest:
+        if fields[NUMERICAL_VALUE_NUMERIC]:
+            add_numeral(
+                code_point_range,
+                *fields[NUMERICAL_VALUE_DECIMAL : NUMERICAL_VALUE_NUMERIC + 1],
+            )
         if decomposition := fields[DECOMPOSITION_MAPPING]:
             _decomposition.extend_last(code_point_range, decomposition)
 
+    assert pending_first is None, "implied range without a last line"
 
-def add_name(code_point_range: CodepointRange, raw_name: str):
+
+def add_name(code_point_range: tuple[int, int], raw_name: str):
     """
     See: https://www.unicode.org/reports/tr44/#Name
     """
-    if code_point_range.is_range:
+    start, end = code_point_range
+    if start != end:
         # I'm too lazy to implement codepoint range rules so...
         # https://www.unicode.org/versions/Unicode14.0.0/ch04.pdf
         _name.extend_last(code_point_range, NotImplemented)
@@ -445,7 +912,7 @@ def add_name(code_point_range: CodepointRange, raw_name: str):
         _name.extend_last(code_point_range, raw_name)
 
 
-def add_numeral(code_point_range: CodepointRange, decimal, digit, numeral):
+def add_numeral(code_point_range: tuple[int, int], decimal, digit, numeral):
     if not numeral:
         # Not a number
         return
@@ -467,16 +934,46 @@ def add_numeral(code_point_range: CodepointRange, decimal, digit, numeral):
         _numeric_value.extend_last(code_point_range, value)
 
 
+def pack_numeric_properties():
+    """
+    Packs the Numeric_Type and Numeric_Value of every code point into _numeric_table,
+    so that asking for a code point's digit value is only one lookup.
+
+    Values that do not fit in a byte (fractions, large numbers) are marked with
+    NUMERIC_EXTRA and are stored in _numeric_extra, already converted to float. Since
+    _numeric_value stores rational values as floats too, use as_fraction() to get one
+    exactly.
+
+    Must be called after parse_unicode_data().
+    """
+    global _numeric_table
+    _numeric_table = array("b", [NOT_NUMERIC]) * (CODE_POINT_MAX + 1)
+
+    for start, end, value in _numeric_value.ranges():
+        for codepoint in range(start, end + 1):
+            numeric_type = _numeric_type.value_id(codepoint)
+            if numeric_type == NumericType.DECIMAL:
+                _numeric_table[codepoint] = value
+            elif numeric_type == NumericType.DIGIT:
+                _numeric_table[codepoint] = value + DIGIT_OFFSET
+            else:
+                _numeric_table[codepoint] = NUMERIC_EXTRA
+                _numeric_extra[codepoint] = float(value)
+
+
 def parse_numeral(numeral: str):
     """
+    Integers stay exact. Everything else is a float: every rational Numeric_Value in
+    the UCD has a small denominator, so as_fraction() can recover it exactly.
+
     >>> parse_numeral("1/5")
-    Fraction(1, 5)
+    0.2
     >>> parse_numeral("19")
     19
     """
     if "/" in numeral:
         nom, _, denom = numeral.partition("/")
-        return Fraction(int(nom), int(denom))
+        return int(nom) / int(denom)
 
     return int(numeral)
 
@@ -492,8 +989,65 @@ def ends_implied_range(name: str) -> bool:
 ####################################### Utilties #######################################
 
 
-def next_or_none(it):
-    try:
-        return next(it)
-    except StopIteration:
-        return None
+def as_fraction(value) -> Fraction:
+    """
+    Returns a numeric value as an exact Fraction.
+
+    >>> as_fraction(parse_numeral("1/3"))
+    Fraction(1, 3)
+    >>> as_fraction(parse_numeral("-1/2"))
+    Fraction(-1, 2)
+    >>> as_fraction(parse_numeral("1000"))
+    Fraction(1000, 1)
+    """
+    # The largest denominator in the UCD is 320, far below where floats get ambiguous:
+    return Fraction(value).limit_denominator(MAX_NUMERIC_DENOMINATOR)
+
+
+def intern_if_str(value):
+    """
+    >>> decimal = "Decimal"
+    >>> intern_if_str("".join(["Dec", "imal"])) is decimal
+    True
+    >>> intern_if_str(None) is None
+    True
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def array_to_marshal(packed: array) -> tuple[str, bytes]:
+    """
+    marshal can't store arrays, but it can store their bytes.
+
+    >>> array_from_marshal(array_to_marshal(array("H", [1, 2, 0xFFFF])))
+    array('H', [1, 2, 65535])
+    """
+    return packed.typecode, packed.tobytes()
+
+
+def array_from_marshal(state: tuple[str, bytes]) -> array:
+    typecode, data = state
+    packed = array(typecode)
+    packed.frombytes(data)
+    return packed
+
+
+def smallest_unsigned_typecode(max_value: int) -> str:
+    """
+    Returns the smallest array typecode that can store all values up to max_value.
+
+    >>> smallest_unsigned_typecode(255)
+    'B'
+    >>> smallest_unsigned_typecode(256)
+    'H'
+    """
+    for typecode in "BHI":
+        if max_value < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    raise OverflowError(max_value)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["--build"]:
+        sys.exit(f"usage: {sys.argv[0]} --build")
+    write_cache(get_cache_path(hash_sources()), parse_all_uncached())